@@ -0,0 +1,315 @@
+import os
+import json
+import time
+import fcntl
+import shutil
+import sqlite3
+import tempfile
+import threading
+import contextlib
+
+LOCK_TIMEOUT = 600  # seconds to wait for a session lock before giving up
+LOCK_STALE_AFTER = 300  # seconds without a heartbeat after which a SQLite lock is considered abandoned
+LOCK_HEARTBEAT_INTERVAL = 30
+LOCK_POLL_INTERVAL = 0.2
+STATE_LOCK_TIMEOUT = 30
+
+@contextlib.contextmanager
+def atomic_open(path, mode="wb", **kwargs):
+    """Open a temp file next to `path` and atomically move it into place on success"""
+    folder = os.path.dirname(path) or "."
+    os.makedirs(folder, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=folder, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, mode, **kwargs) as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def atomic_write(path, data):
+    """Write bytes to path atomically via a temp file in the same directory"""
+    with atomic_open(path) as f:
+        f.write(data)
+
+class _Heartbeat(threading.Thread):
+    """Calls `beat` periodically while a lock is held so it never looks stale"""
+
+    def __init__(self, beat, interval=LOCK_HEARTBEAT_INTERVAL):
+        super().__init__(name="lock-heartbeat", daemon=True)
+        self.beat = beat
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                self.beat()
+            except Exception as e:
+                print(f"Lock heartbeat failed: {e}")
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+class LocalBackend:
+    """Session state, artifacts and locks kept as files under a shared directory"""
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+
+    def session_dir(self, session_id):
+        """Folder where raw response data for a session is written"""
+        return os.path.join(self.root, "sessions", session_id)
+
+    def load_state(self, session_id):
+        path = os.path.join(self.root, "state", f"{session_id}.json")
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def save_state(self, session_id, state):
+        path = os.path.join(self.root, "state", f"{session_id}.json")
+        atomic_write(path, json.dumps(state).encode("utf-8"))
+
+    def update_state(self, session_id, update):
+        """Read-modify-write session state; `update` mutates the state dict in place.
+
+        Uses a short state lock separate from the session lock, so UI events
+        are not blocked by a running extraction.
+        """
+        with self.lock(f"{session_id}.state", timeout=STATE_LOCK_TIMEOUT):
+            state = self.load_state(session_id)
+            update(state)
+            self.save_state(session_id, state)
+        return state
+
+    def artifact_root(self):
+        """Folder artifacts are served from; the only path exposed for download"""
+        return os.path.join(self.root, "artifacts")
+
+    def write_artifact(self, session_id, name, data):
+        """Store an artifact and return a local path it can be served from"""
+        return self.write_artifact_stream(session_id, name, lambda f: f.write(data))
+
+    def write_artifact_stream(self, session_id, name, write):
+        """Store an artifact produced by `write(file)` without holding it in memory"""
+        path = os.path.join(self.artifact_root(), session_id, name)
+        with atomic_open(path) as f:
+            write(f)
+        return path
+
+    def stored_sessions(self):
+        """Return {session_id: last update time} for sessions with saved state or artifacts"""
+        sessions = {}
+        state_root = os.path.join(self.root, "state")
+        if os.path.isdir(state_root):
+            for entry in os.scandir(state_root):
+                if entry.is_file() and entry.name.endswith(".json"):
+                    sessions[entry.name[:-len(".json")]] = entry.stat().st_mtime
+        artifact_root = self.artifact_root()
+        if os.path.isdir(artifact_root):
+            for entry in os.scandir(artifact_root):
+                if entry.is_dir():
+                    updated = max((f.stat().st_mtime for f in os.scandir(entry.path)), default=entry.stat().st_mtime)
+                    sessions[entry.name] = max(sessions.get(entry.name, 0), updated)
+        return sessions
+
+    def delete_session(self, session_id):
+        """Remove a session's raw data, state and artifacts"""
+        shutil.rmtree(self.session_dir(session_id), ignore_errors=True)
+        shutil.rmtree(os.path.join(self.artifact_root(), session_id), ignore_errors=True)
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(os.path.join(self.root, "state", f"{session_id}.json"))
+
+    @contextlib.contextmanager
+    def lock(self, session_id, timeout=LOCK_TIMEOUT):
+        """Exclusive per-session lock shared by every process using this root.
+
+        Held as an flock on locks/<session_id>.lock, so the OS releases it
+        when a worker dies and no stale lock has to be broken.
+        """
+        path = os.path.join(self.root, "locks", f"{session_id}.lock")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        deadline = time.time() + timeout
+        while True:
+            fd = os.open(path, os.O_CREAT | os.O_RDWR)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(fd)
+                if time.time() > deadline:
+                    raise TimeoutError(f"Timed out waiting for session lock {session_id}")
+                time.sleep(LOCK_POLL_INTERVAL)
+                continue
+            # The previous holder removes the file on release; only a lock on
+            # the file still at `path` counts
+            try:
+                if os.stat(path).st_ino == os.fstat(fd).st_ino:
+                    break
+            except FileNotFoundError:
+                pass
+            os.close(fd)
+        try:
+            yield
+        finally:
+            # Removed while still locked, so no waiter can lock the old file
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(path)
+            os.close(fd)
+
+class SQLiteBackend(LocalBackend):
+    """Session state, artifacts and locks kept in a shared SQLite database.
+
+    Raw response data is still written under `root`, which must be shared
+    between workers; artifacts are materialized locally before being served.
+    """
+
+    def __init__(self, db_path, root):
+        super().__init__(root)
+        self.db_path = db_path
+        with contextlib.closing(self._connect()) as conn:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS session_state (
+                    session_id TEXT PRIMARY KEY, state TEXT NOT NULL, updated_at REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS artifacts (
+                    session_id TEXT NOT NULL, name TEXT NOT NULL, data BLOB NOT NULL, updated_at REAL NOT NULL,
+                    PRIMARY KEY (session_id, name)
+                );
+                CREATE TABLE IF NOT EXISTS session_locks (
+                    session_id TEXT PRIMARY KEY, owner TEXT NOT NULL, acquired_at REAL NOT NULL
+                );
+            """)
+
+    def _connect(self):
+        folder = os.path.dirname(self.db_path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def load_state(self, session_id):
+        with contextlib.closing(self._connect()) as conn:
+            row = conn.execute("SELECT state FROM session_state WHERE session_id = ?", (session_id,)).fetchone()
+        return json.loads(row[0]) if row else {}
+
+    def save_state(self, session_id, state):
+        with contextlib.closing(self._connect()) as conn, conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO session_state (session_id, state, updated_at) VALUES (?, ?, ?)",
+                (session_id, json.dumps(state), time.time())
+            )
+
+    def update_state(self, session_id, update):
+        """Read-modify-write session state inside a single write transaction"""
+        conn = self._connect()
+        conn.isolation_level = None
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute("SELECT state FROM session_state WHERE session_id = ?", (session_id,)).fetchone()
+                state = json.loads(row[0]) if row else {}
+                update(state)
+                conn.execute(
+                    "INSERT OR REPLACE INTO session_state (session_id, state, updated_at) VALUES (?, ?, ?)",
+                    (session_id, json.dumps(state), time.time())
+                )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        finally:
+            conn.close()
+        return state
+
+    def artifact_root(self):
+        """Local folder artifacts are materialized into before being served"""
+        return os.path.join(tempfile.gettempdir(), "data_connector")
+
+    def write_artifact_stream(self, session_id, name, write):
+        # Written to the local copy first, then copied into the database in chunks
+        path = super().write_artifact_stream(session_id, name, write)
+        with contextlib.closing(self._connect()) as conn, conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO artifacts (session_id, name, data, updated_at) VALUES (?, ?, zeroblob(?), ?)",
+                (session_id, name, os.path.getsize(path), time.time())
+            )
+            rowid = conn.execute(
+                "SELECT rowid FROM artifacts WHERE session_id = ? AND name = ?", (session_id, name)
+            ).fetchone()[0]
+            with open(path, "rb") as src, conn.blobopen("artifacts", "data", rowid) as blob:
+                shutil.copyfileobj(src, blob)
+        return path
+
+    def stored_sessions(self):
+        with contextlib.closing(self._connect()) as conn:
+            rows = conn.execute(
+                "SELECT session_id, MAX(updated_at) FROM ("
+                "SELECT session_id, updated_at FROM session_state "
+                "UNION ALL SELECT session_id, updated_at FROM artifacts) GROUP BY session_id"
+            ).fetchall()
+        return dict(rows)
+
+    def delete_session(self, session_id):
+        shutil.rmtree(self.session_dir(session_id), ignore_errors=True)
+        shutil.rmtree(os.path.join(self.artifact_root(), session_id), ignore_errors=True)
+        with contextlib.closing(self._connect()) as conn, conn:
+            conn.execute("DELETE FROM session_state WHERE session_id = ?", (session_id,))
+            conn.execute("DELETE FROM artifacts WHERE session_id = ?", (session_id,))
+
+    @contextlib.contextmanager
+    def lock(self, session_id, timeout=LOCK_TIMEOUT):
+        owner = f"{os.getpid()}-{id(self)}-{time.time()}"
+        deadline = time.time() + timeout
+        while True:
+            with contextlib.closing(self._connect()) as conn, conn:
+                conn.execute(
+                    "DELETE FROM session_locks WHERE session_id = ? AND acquired_at < ?",
+                    (session_id, time.time() - LOCK_STALE_AFTER)
+                )
+                acquired = conn.execute(
+                    "INSERT OR IGNORE INTO session_locks (session_id, owner, acquired_at) VALUES (?, ?, ?)",
+                    (session_id, owner, time.time())
+                ).rowcount == 1
+            if acquired:
+                break
+            if time.time() > deadline:
+                raise TimeoutError(f"Timed out waiting for session lock {session_id}")
+            time.sleep(LOCK_POLL_INTERVAL)
+
+        def beat():
+            with contextlib.closing(self._connect()) as conn, conn:
+                conn.execute(
+                    "UPDATE session_locks SET acquired_at = ? WHERE session_id = ? AND owner = ?",
+                    (time.time(), session_id, owner)
+                )
+
+        heartbeat = _Heartbeat(beat)
+        heartbeat.start()
+        try:
+            yield
+        finally:
+            heartbeat.stop()
+            with contextlib.closing(self._connect()) as conn, conn:
+                conn.execute("DELETE FROM session_locks WHERE session_id = ? AND owner = ?", (session_id, owner))
+
+_backend = None
+
+def get_backend():
+    """Return the configured backend (STATE_BACKEND=local|sqlite, DATA_ROOT, STATE_DB_PATH)"""
+    global _backend
+    if _backend is None:
+        root = os.getenv("DATA_ROOT", ".")
+        if os.getenv("STATE_BACKEND", "local").lower() == "sqlite":
+            _backend = SQLiteBackend(os.getenv("STATE_DB_PATH", os.path.join(root, "state.db")), root)
+        else:
+            _backend = LocalBackend(root)
+    return _backend
@@ -0,0 +1,71 @@
+import json
+import hashlib
+import threading
+import requests
+
+class CoalescedRequestError(requests.RequestException):
+    """Raised to callers that waited on a shared request which failed"""
+
+class _InFlight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.response = None
+        self.error = None
+
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+def auth_scope(headers=None, auth=None, scope=None):
+    """Digest of the credentials a request is made with, so different users never share a response.
+
+    `scope` replaces the headers/auth when callers hold different short-lived
+    tokens for the same identity (e.g. one OAuth client).
+    """
+    if scope is not None:
+        return hashlib.sha256(f"scope:{scope}".encode("utf-8")).hexdigest()
+    material = json.dumps({
+        "authorization": (headers or {}).get("Authorization"),
+        "auth": list(auth) if auth else None
+    }, sort_keys=True)
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+def request_key(url, headers=None, auth=None, params=None, scope=None):
+    """Key identifying identical GETs: (tenant + endpoint URL, params, auth scope)"""
+    return (url, json.dumps(params or {}, sort_keys=True), auth_scope(headers, auth, scope))
+
+def coalesced_get(url, headers=None, auth=None, params=None, scope=None, **kwargs):
+    """requests.get that shares one in-flight call between identical concurrent requests.
+
+    The first caller performs the request and reads the full body; callers
+    that arrive while it is in flight wait and receive the same response, or
+    a CoalescedRequestError chained to the leader's exception. Nothing is
+    cached once the call completes.
+    """
+    key = request_key(url, headers, auth, params, scope)
+    with _inflight_lock:
+        call = _inflight.get(key)
+        leader = call is None
+        if leader:
+            call = _InFlight()
+            _inflight[key] = call
+
+    if not leader:
+        call.done.wait()
+        if call.response is None:
+            # A new exception per waiter; re-raising the leader's from several
+            # threads would keep growing its traceback
+            raise CoalescedRequestError(f"Shared request to {url} failed: {call.error!r}") from call.error
+        return call.response
+
+    try:
+        response = requests.get(url, headers=headers, auth=auth, params=params, **kwargs)
+        response.content  # read the body once so every waiter can reuse it
+        call.response = response
+        return response
+    except BaseException as e:
+        call.error = e
+        raise
+    finally:
+        with _inflight_lock:
+            _inflight.pop(key, None)
+        call.done.set()
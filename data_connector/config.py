@@ -0,0 +1,8 @@
+from pathlib import Path
+from dotenv import load_dotenv
+
+# Imported first by every entry point, so settings from .env are in the
+# environment before any module reads them
+script_dir = Path(__file__).resolve().parent
+env_path = script_dir / '.env'
+load_dotenv(dotenv_path=env_path)
@@ -1,24 +1,27 @@
+import config  # loads .env before the modules below read their settings
 import requests
 import yaml
 from identityNow import handle_identitynow_call
 from okta import handle_okta_call
 from iiq import handle_iiq_call
-from utils import extract_path_params, extract_query_params
+from backends import get_backend
+from retention import start_sweeper
+from pagination import VENDOR_PAGING, declares_param
+from profiling import PROFILE_MODES, default_mode, profile_run, span, timed
+from utils import extract_path_params, extract_query_params, build_param_rows, collect_param_values, PARAM_COLUMNS
 import gradio as gr
 import os
-from dotenv import load_dotenv
-from pathlib import Path
-
-script_dir = Path(__file__).resolve().parent
-env_path = script_dir / '.env'
-load_dotenv(dotenv_path=env_path)
+import sys
+import uuid
 
 def fetch_api_endpoints_yaml(spec_url):
     try:
-        response = requests.get(spec_url)
+        with span("spec fetch"):
+            response = requests.get(spec_url)
         response.raise_for_status()
         content = response.text
-        api_spec = yaml.safe_load(content)
+        with span("spec parse"):
+            api_spec = yaml.safe_load(content)
     except Exception as e:
         print(f"Error fetching/parsing YAML spec from {spec_url}: {e}")
         return {}
@@ -55,9 +58,11 @@ def fetch_api_endpoints_yaml(spec_url):
 
 def fetch_api_endpoints_json(spec_url):
     try:
-        response = requests.get(spec_url)
+        with span("spec fetch"):
+            response = requests.get(spec_url)
         response.raise_for_status()
-        api_spec = response.json()
+        with span("spec parse"):
+            api_spec = response.json()
     except Exception as e:
         print(f"Error fetching/parsing JSON spec from {spec_url}: {e}")
         return {}
@@ -92,6 +97,7 @@ def fetch_api_endpoints_json(spec_url):
             endpoints[path][method.lower()] = endpoint_info
     return endpoints
 
+@timed("spec load")
 def get_endpoints(spec_choice):
     api_spec_options = {
         "Okta (JSON)": os.getenv("OKTA_API_SPEC"),
@@ -131,6 +137,49 @@ def group_endpoints(endpoints, spec_choice):
     
     return groups
 
+ALL_GROUPS = "All groups"
+PAGE_SIZE = 50
+# Pagination conventions (see pagination.VENDOR_PAGING) for each spec
+SPEC_VENDORS = {
+    "Okta (JSON)": "Okta",
+    "SailPoint IdentityNow (YAML)": "IdentityNow",
+    "Sailpoint IIQ (YAML)": "IIQ"
+}
+_catalog_cache = {}
+
+def build_catalog(endpoints, spec_choice):
+    """Build the GET endpoint catalog as {group: [choice labels]}"""
+    catalog = {}
+    for group, paths in group_endpoints(endpoints, spec_choice).items():
+        choices = []
+        for ep, methods in paths.items():
+            if 'get' in methods:
+                summary = methods['get'].get('summary', 'No summary')
+                choices.append(f"{ep} | GET - {summary}")
+        if choices:
+            catalog[group] = choices
+    return catalog
+
+def get_catalog(spec_choice, refresh=False):
+    """Return (endpoints, catalog) for a spec, fetching the spec only once"""
+    if refresh or spec_choice not in _catalog_cache:
+        endpoints = get_endpoints(spec_choice)
+        _catalog_cache[spec_choice] = (endpoints, build_catalog(endpoints, spec_choice))
+    return _catalog_cache[spec_choice]
+
+def search_catalog(catalog, query, group, page, page_size=PAGE_SIZE):
+    """Return (page choices, page, total pages, total matches) for a search"""
+    query = (query or "").strip().lower()
+    if group and group != ALL_GROUPS:
+        candidates = catalog.get(group, [])
+    else:
+        candidates = [choice for choices in catalog.values() for choice in choices]
+    matches = [choice for choice in candidates if query in choice.lower()] if query else candidates
+    total_pages = max(1, -(-len(matches) // page_size))
+    page = min(max(page, 0), total_pages - 1)
+    start = page * page_size
+    return matches[start:start + page_size], page, total_pages, len(matches)
+
 with gr.Blocks(
     theme=gr.themes.Default(
         primary_hue=gr.themes.colors.red,
@@ -142,14 +191,17 @@ with gr.Blocks(
     )
 ) as demo:
     gr.Markdown("# Data Connector Demo")
-    gr.Markdown("Select an API spec, then click Refresh Endpoints to see available endpoints grouped in accordions.")
+    gr.Markdown("Select an API spec, then click Refresh Endpoints to browse and search the available endpoints.")
     
-    # Session state
-    session_id_state = gr.State("")
-    confirmed_endpoints_state = gr.State([])
-    display_values_state = gr.State([])
-    
-    max_groups = 100
+    # Session state: only the session id lives in the browser, everything else
+    # is kept in the shared state backend so any worker can serve the session.
+    # A fixed key and a secret shared by all workers let each of them decrypt it.
+    session_id_state = gr.BrowserState(
+        "",
+        storage_key="data_connector_session",
+        secret=os.getenv("SESSION_STATE_SECRET")
+    )
+    page_state = gr.State(0)
     
     # API Spec Selection
     with gr.Row():
@@ -163,28 +215,30 @@ with gr.Blocks(
     # Loading indicator
     loading_status = gr.Markdown("Select an API spec and click 'Refresh Endpoints' to load available endpoints.")
     
-    # Create accordion placeholders
-    accordion_placeholders = []
+    # Endpoint browser: only the current page of the catalog is sent to the client
     with gr.Column():
-        for i in range(max_groups):
-            with gr.Accordion(label="", open=False, visible=False) as acc:
-                cb = gr.CheckboxGroup(label="", choices=[], value=[])
-            accordion_placeholders.append((acc, cb))
+        with gr.Row():
+            endpoint_search = gr.Textbox(label="Search endpoints", placeholder="e.g. /sod-policies")
+            group_filter = gr.Dropdown(label="Group", choices=[ALL_GROUPS], value=ALL_GROUPS)
+        endpoint_page = gr.CheckboxGroup(label="GET endpoints", choices=[], value=[])
+        with gr.Row():
+            prev_page_btn = gr.Button("◀ Previous")
+            page_info = gr.Markdown("Page 1 of 1")
+            next_page_btn = gr.Button("Next ▶")
+        selected_summary = gr.Markdown("No endpoints selected")
     
-    # Parameter group
+    # Parameter group: one row per (endpoint, parameter), any number of rows
     with gr.Group(visible=False) as param_group:
         param_header = gr.Markdown("### Parameters Required")  # Default header
-        param_components = []
-        with gr.Column() as param_container:
-            for i in range(5):
-                with gr.Group(visible=False) as group:
-                    display = gr.Markdown(visible=False)
-                    input_box = gr.Textbox(
-                        label="Parameter Value",
-                        visible=False,
-                        interactive=True
-                    )
-                    param_components.append((group, display, input_box))
+        param_table = gr.Dataframe(
+            headers=PARAM_COLUMNS,
+            datatype=["str"] * len(PARAM_COLUMNS),
+            col_count=(len(PARAM_COLUMNS), "fixed"),
+            type="array",
+            interactive=True,
+            wrap=True,
+            label="Fill in the Value column"
+        )
     
     # Authentication sections
     with gr.Group() as identitynow_auth:
@@ -202,6 +256,11 @@ with gr.Blocks(
             iiq_password = gr.Textbox(label="Enter IIQ Password", type="password")
     
     api_base_url = gr.Textbox(label="Enter API Base URL")
+    profile_mode = gr.Dropdown(
+        label="Profiling (timings and profiles are saved in the session folder)",
+        choices=PROFILE_MODES,
+        value=default_mode()
+    )
     
     # Buttons
     confirm_endpoints_btn = gr.Button("Submit and Confirm Endpoints", variant="primary")
@@ -211,62 +270,80 @@ with gr.Blocks(
     responses_out = gr.JSON(label="API Responses")
     download_out = gr.File(label="Download Session Data (ZIP)")
 
-    def update_acc(spec_choice):
-        """Update accordions with endpoints"""
-        try:
-            endpoints = get_endpoints(spec_choice)
-            
-            if not endpoints:
-                return [gr.update(visible=False)] * (max_groups * 2) + ["⚠️ No endpoints found"]
-            
-            groups = group_endpoints(endpoints, spec_choice)
-            group_keys = list(groups.keys())
+    def load_selection(session_id):
+        """Selected endpoints are kept in the shared backend, not in worker memory"""
+        if not session_id:
+            return []
+        return get_backend().load_state(session_id).get("selected_endpoints", [])
 
-            if not group_keys:
-                return [gr.update(visible=False)] * (max_groups * 2) + ["⚠️ No endpoint groups found"]
-                
-            updates = []
-            
-            # Always process exactly max_groups number of slots
-            for i in range(max_groups):
-                if i < len(group_keys):
-                    group = group_keys[i]
-                    choices = []
-                    # Collect GET endpoints for this group
-                    for ep, methods in groups[group].items():
-                        if 'get' in methods:
-                            summary = methods['get'].get('summary', 'No summary')
-                            label = f"{ep} | GET - {summary}"
-                            choices.append(label)
-                    
-                    # Add updates regardless of choices
-                    acc_update = gr.update(
-                        label=f"Group: {group}" if choices else "",
-                        visible=bool(choices),
-                        open=(i == 0 and bool(choices))
-                    )
-                    cb_update = gr.update(choices=choices, value=[], visible=bool(choices))
-                    updates.append((acc_update, cb_update))
-                else:
-                    # Fill remaining slots with hidden updates
-                    acc_update = gr.update(visible=False, label="")
-                    cb_update = gr.update(visible=False, choices=[], value=[])
-                    updates.append((acc_update, cb_update))
+    def save_session_state(session_id, **values):
+        get_backend().update_state(session_id, lambda state: state.update(values))
 
-            # Flatten updates and add status message
-            flattened = []
-            for up in updates:
-                flattened.extend(up)  # This will give us exactly max_groups * 2 updates
-            
-            visible_groups = sum(1 for group in groups.values() if any('get' in methods for methods in group.values()))
-            success_msg = f"✅ Loaded {visible_groups} groups with GET endpoints"
-            flattened.append(success_msg)
-            
-            return flattened
-                
+    def render_page(spec_choice, query, group, page, session_id):
+        """Render one page of the endpoint catalog"""
+        selected = load_selection(session_id)
+        _, catalog = get_catalog(spec_choice)
+        choices, page, total_pages, total = search_catalog(catalog, query, group, page)
+        return (
+            gr.update(choices=choices, value=[c for c in choices if c in selected]),
+            f"Page {page + 1} of {total_pages} ({total} endpoints)",
+            page
+        )
+
+    def update_catalog(spec_choice, session_id, profile_mode):
+        """Reload the spec catalog and show its first page"""
+        session_id = session_id or str(uuid.uuid4())
+        try:
+            with profile_run(get_backend().session_dir(session_id), profile_mode):
+                _, catalog = get_catalog(spec_choice, refresh=True)
+            if not catalog:
+                status = "⚠️ No GET endpoints found"
+            else:
+                status = f"✅ Loaded {len(catalog)} groups with GET endpoints"
+            save_session_state(session_id, selected_endpoints=[])
+            page_update, info, page = render_page(spec_choice, "", ALL_GROUPS, 0, session_id)
+            return (
+                gr.update(choices=[ALL_GROUPS, *catalog.keys()], value=ALL_GROUPS),
+                gr.update(value=""),
+                page_update, info, page, session_id, "No endpoints selected", status
+            )
         except Exception as e:
             error_msg = f"❌ Error loading endpoints: {str(e)}"
-            return [gr.update(visible=False)] * (max_groups * 2) + [error_msg]
+            return (
+                gr.update(choices=[ALL_GROUPS], value=ALL_GROUPS), gr.update(value=""),
+                gr.update(choices=[], value=[]), "Page 1 of 1", 0, session_id, "No endpoints selected", error_msg
+            )
+
+    def reset_browser(session_id):
+        """Clear the browser and selection when another spec is chosen"""
+        if session_id:
+            save_session_state(session_id, selected_endpoints=[])
+        return (
+            gr.update(choices=[ALL_GROUPS], value=ALL_GROUPS), gr.update(value=""),
+            gr.update(choices=[], value=[]), "Page 1 of 1", 0, "No endpoints selected",
+            "Click 'Refresh Endpoints' to load the endpoints of this spec.",
+            gr.update(visible=False), gr.update(value=[])
+        )
+
+    def change_page(spec_choice, query, group, page, session_id, step):
+        return render_page(spec_choice, query, group, page + step, session_id)
+
+    def update_selection(spec_choice, query, group, page, session_id, checked):
+        """Merge the checked items of the current page into the overall selection"""
+        session_id = session_id or str(uuid.uuid4())
+        _, catalog = get_catalog(spec_choice)
+        page_choices, _, _, _ = search_catalog(catalog, query, group, page)
+        on_page = set(page_choices)
+
+        def merge(state):
+            # Runs under the state lock so concurrent page edits are not lost
+            selected = [s for s in state.get("selected_endpoints", []) if s not in on_page or s in checked]
+            selected.extend(c for c in checked if c not in selected)
+            state["selected_endpoints"] = selected
+
+        selected = get_backend().update_state(session_id, merge)["selected_endpoints"]
+        summary = f"{len(selected)} endpoints selected" if selected else "No endpoints selected"
+        return session_id, summary
         
     def update_auth_fields(api_choice):
         updates = {
@@ -281,20 +358,15 @@ with gr.Blocks(
             gr.update(visible=visibilities[2])
         ]
 
-    def confirm_selected_endpoints(spec_choice, *checkbox_values):
+    def confirm_selected_endpoints(spec_choice, session_id):
         """Collect and confirm all selected endpoints"""
-        all_selected = []
-        
-        for checkbox_group in checkbox_values:
-            if isinstance(checkbox_group, list) and checkbox_group:
-                all_selected.extend(checkbox_group)
+        all_selected = load_selection(session_id)
         
         # Get the API spec
-        endpoints = get_endpoints(spec_choice)
+        endpoints, _ = get_catalog(spec_choice)
         
         # Process selected endpoints to find ones with parameters
         endpoints_with_params = []
-        display_values = []  # Track display values
         for selection in all_selected:
             endpoint = selection.split(" | ")[0]
             endpoint_spec = endpoints.get(endpoint, {}).get('get', {})
@@ -305,13 +377,7 @@ with gr.Blocks(
             
             if path_params or query_params:
                 endpoints_with_params.append((endpoint, path_params, query_params))
-                display_values.append(f"Endpoint: {endpoint}")
 
-        # Create updates for all components
-        updates = []
-        updates.append(endpoints_with_params)  # confirmed_endpoints_state
-        updates.append(display_values)  # display_values_state
-        
         # Determine parameter types present
         has_path_params = any(path_params for _, path_params, _ in endpoints_with_params)
         has_query_params = any(query_params for _, _, query_params in endpoints_with_params)
@@ -326,85 +392,39 @@ with gr.Blocks(
         else:
             header_text = "### Parameters Required"
         
-        # Update group visibility and header text separately
-        updates.append(gr.update(visible=bool(endpoints_with_params)))  # param_group visibility
-        updates.append(gr.update(value=header_text, visible=True))  # param_header update
-
-        # Then create updates for each parameter component
-        param_index = 0
-        for i in range(100):  # Assuming max 5 endpoints
-            if i < len(endpoints_with_params):
-                endpoint, path_params, query_params = endpoints_with_params[i]
-                
-                # Handle path parameters
-                for param_name in path_params:  # Changed: iterate directly over parameter names
-                    if param_index < 5:  # Stay within component limit
-                        updates.extend([
-                            gr.update(visible=True),
-                            gr.update(visible=True, value=f"Endpoint: {endpoint} - Path Parameter"),
-                            gr.update(
-                                visible=True,
-                                label=f"Enter path parameter: {param_name}",
-                                placeholder=f"Required path parameter for {endpoint}"
-                            )
-                        ])
-                        param_index += 1
-                
-                # Handle query parameters
-                for param in query_params:  # Changed: handle query parameter tuples
-                    _, name, required, description = param  # Unpack all 4 values
-                    if param_index < 5:  # Stay within component limit
-                        updates.extend([
-                            gr.update(visible=True),
-                            gr.update(visible=True, value=f"Endpoint: {endpoint} - Query Parameter"),
-                            gr.update(
-                                visible=True,
-                                label=f"Enter query parameter: {name}" + (" (Required)" if required else " (Optional)"),
-                                placeholder=description
-                            )
-                        ])
-                        param_index += 1
-
-        # Fill remaining parameter components with hidden updates
-        while param_index < 5:
-            updates.extend([
-                gr.update(visible=False),
-                gr.update(visible=False, value=""),
-                gr.update(visible=False, label="")
-            ])
-            param_index += 1
-        
-        return updates
+        return (
+            gr.update(visible=bool(endpoints_with_params)),  # param_group visibility
+            gr.update(value=header_text, visible=True),  # param_header update
+            gr.update(value=build_param_rows(endpoints_with_params))  # param_table rows
+        )
     
     def handle_api_call(spec_choice, api_base_url, session_id, grant_type, client_id, client_secret, 
-                   api_token, iiq_username, iiq_password, display_values, *args):
-        # Create param_values dictionary
-        num_params = len(param_components)
-        path_params = {}
-        query_params = {}
-        
-        for i, display_value in enumerate(display_values):
-            if display_value and args[i]:
-                endpoint_text = display_value.split(": ")[1].split(" - ")[0]
-                param_type = "path" if "Path Parameter" in display_value else "query"
-                param_name = args[i].split(":")[0].strip()
-                
-                if param_type == "path":
-                    path_params[param_name] = args[i]
-                else:
-                    query_params[param_name] = args[i]
+                   api_token, iiq_username, iiq_password, param_rows, profile_mode):
+        # Parameter values keyed by endpoint, then by location and name
+        param_values = collect_param_values(param_rows)
+        selected = load_selection(session_id)
+        checkbox_values = [selected]
         
-        checkbox_values = args[num_params:]
+        # Page through collection endpoints whose spec declares the vendor's page size parameter
+        vendor = SPEC_VENDORS.get(spec_choice)
+        size_param = VENDOR_PAGING[vendor]["size_param"] if vendor else None
+        endpoints, _ = get_catalog(spec_choice)
+        for selection in selected:
+            endpoint = selection.split(" | ")[0]
+            spec_params = endpoints.get(endpoint, {}).get('get', {}).get('parameters', [])
+            if size_param and declares_param(spec_params, size_param):
+                param_values.setdefault(endpoint, {"path": {}, "query": {}})["paged"] = True
         
         try:
             if spec_choice == "Okta (JSON)":
-                return handle_okta_call(api_base_url, api_token, session_id, path_params, query_params, *checkbox_values)
+                return handle_okta_call(api_base_url, api_token, session_id, param_values, *checkbox_values,
+                                        profile_mode=profile_mode)
             elif spec_choice == "SailPoint IdentityNow (YAML)":
                 return handle_identitynow_call(api_base_url, grant_type, client_id, client_secret, 
-                                        session_id, path_params, query_params, *checkbox_values)
+                                        session_id, param_values, *checkbox_values, profile_mode=profile_mode)
             else:  # IIQ
                 return handle_iiq_call(api_base_url, iiq_username, iiq_password, session_id, 
-                                path_params, query_params, *checkbox_values)
+                                param_values, *checkbox_values, profile_mode=profile_mode)
         except Exception as e:
             print(f"Error in handle_api_call: {str(e)}")
             return (
@@ -420,26 +440,59 @@ with gr.Blocks(
         inputs=[spec_choice],
         outputs=[identitynow_auth, okta_auth, iiq_auth]
     )
+    spec_choice.change(
+        fn=reset_browser,
+        inputs=[session_id_state],
+        outputs=[group_filter, endpoint_search, endpoint_page, page_info, page_state,
+                 selected_summary, loading_status, param_group, param_table]
+    )
     
     refresh_eps.click(
-        fn=update_acc,
-        inputs=spec_choice,
-        outputs=[*[accordion_placeholders[i][j] for i in range(max_groups) for j in range(2)], loading_status]
+        fn=update_catalog,
+        inputs=[spec_choice, session_id_state, profile_mode],
+        outputs=[group_filter, endpoint_search, endpoint_page, page_info, page_state,
+                 session_id_state, selected_summary, loading_status]
+    )
+    
+    # .input only fires on user edits, so resetting these from a handler does
+    # not trigger another render
+    browse_inputs = [spec_choice, endpoint_search, group_filter]
+    endpoint_search.input(
+        fn=lambda spec, query, group, session_id: render_page(spec, query, group, 0, session_id),
+        inputs=[*browse_inputs, session_id_state],
+        outputs=[endpoint_page, page_info, page_state]
+    )
+    group_filter.input(
+        fn=lambda spec, query, group, session_id: render_page(spec, query, group, 0, session_id),
+        inputs=[*browse_inputs, session_id_state],
+        outputs=[endpoint_page, page_info, page_state]
+    )
+    prev_page_btn.click(
+        fn=lambda *args: change_page(*args, step=-1),
+        inputs=[*browse_inputs, page_state, session_id_state],
+        outputs=[endpoint_page, page_info, page_state]
+    )
+    next_page_btn.click(
+        fn=lambda *args: change_page(*args, step=1),
+        inputs=[*browse_inputs, page_state, session_id_state],
+        outputs=[endpoint_page, page_info, page_state]
+    )
+    endpoint_page.input(
+        fn=update_selection,
+        inputs=[*browse_inputs, page_state, session_id_state, endpoint_page],
+        outputs=[session_id_state, selected_summary]
     )
     
     confirm_endpoints_btn.click(
         fn=confirm_selected_endpoints,
         inputs=[
             spec_choice,
-            *[acc_cb[1] for acc_cb in accordion_placeholders]
+            session_id_state
         ],
         outputs=[
-            confirmed_endpoints_state,
-            display_values_state,
             param_group,
-            param_header,  # Add param_header to outputs
-            *[item for group, display, input_box in param_components 
-            for item in (group, display, input_box)]
+            param_header,
+            param_table
         ]
     )
     
@@ -455,15 +508,26 @@ with gr.Blocks(
             api_token,
             iiq_username,
             iiq_password,
-            display_values_state,
-            *[input_box for _, _, input_box in param_components],
-            *[acc_cb[1] for acc_cb in accordion_placeholders]
+            param_table,
+            profile_mode
         ],
         outputs=[responses_out, download_out, session_id_state, loading_status]
     )
     
 if __name__ == "__main__":
+    if not os.getenv("SESSION_STATE_SECRET"):
+        # Gradio then picks a random secret per process: other workers (and this
+        # one after a restart) cannot read the session id and start a new session
+        print(
+            "WARNING: SESSION_STATE_SECRET is not set. Sessions are only recognized by the "
+            "worker that created them; set it to the same value on every worker.",
+            file=sys.stderr
+        )
+    sweep_interval = int(os.getenv("RETENTION_SWEEP_INTERVAL", "3600"))
+    if sweep_interval > 0:
+        start_sweeper(sweep_interval)
     demo.launch(
         favicon_path="https://www.sailpoint.com/wp-content/uploads/2020/08/favicon.png",
-        show_error=True
+        show_error=True,
+        allowed_paths=[get_backend().artifact_root()]
     )
\ No newline at end of file
@@ -1,10 +1,11 @@
-import requests
-import datetime
-import json
 import os
 import uuid
 import traceback
-from utils import zip_session_folder, handle_path_parameters
+from utils import handle_path_parameters, save_response_data, create_session_zip
+from backends import get_backend
+from store import ingest_response
+from pagination import fetch_endpoint
+from profiling import profile_run, finish_profile
 
 def validate_okta_token(api_token):
     """Validate Okta API token"""
@@ -20,37 +21,14 @@ def validate_okta_token(api_token):
             "message": str(e)
         }
     
-def save_response_data(data, endpoint, base_save_folder):
-    """Save API response data to file"""
-    safe_endpoint_name = endpoint.strip("/").replace("/", "_") or "root"
-    timestamp = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-    save_folder = os.path.join(base_save_folder, f"{safe_endpoint_name} ({timestamp})")
-    os.makedirs(save_folder, exist_ok=True)
-    
-    filename = os.path.join(save_folder, "data.jsonl")
-    with open(filename, "w", encoding="utf-8") as f:
-        if isinstance(data, list):
-            for item in data:
-                f.write(json.dumps(item) + "\n")
-        elif isinstance(data, dict):
-            f.write(json.dumps(data) + "\n")
-        else:
-            f.write(str(data))
-
-def create_session_zip(session_id):
-    """Create ZIP file of session data"""
-    session_folder = os.path.join("sessions", session_id)
-    zip_file = zip_session_folder(session_folder)
-    zip_filename = f"session_{session_id}.zip"
-    with open(zip_filename, "wb") as f:
-        f.write(zip_file.read())
-    return zip_filename
-
-def handle_okta_call(api_base_url, api_token, session_id, param_values, *checkbox_values):
-    """Handle Okta API calls with parameter support"""
+def handle_okta_call(api_base_url, api_token, session_id, param_values, *checkbox_values, profile_mode=None):
+    """Handle Okta API calls with parameter support, optionally profiled"""
     if not session_id:
         session_id = str(uuid.uuid4())
-    
+    with profile_run(get_backend().session_dir(session_id), profile_mode):
+        return _run_okta_call(api_base_url, api_token, session_id, param_values, *checkbox_values)
+
+def _run_okta_call(api_base_url, api_token, session_id, param_values, *checkbox_values):
     if not api_base_url.startswith('https://'):
         api_base_url = f"https://{api_base_url}"
     
@@ -60,50 +38,69 @@ def handle_okta_call(api_base_url, api_token, session_id, param_values, *checkbo
     }
     
     responses = {}
-    base_save_folder = os.path.join("sessions", session_id, "Okta")
+    backend = get_backend()
+    base_save_folder = os.path.join(backend.session_dir(session_id), "Okta")
     os.makedirs(base_save_folder, exist_ok=True)
     
-    # Process selected endpoints
-    for selections in checkbox_values:
-        if isinstance(selections, list):
-            for selection in selections:
-                try:
-                    if " | " in selection:
-                        endpoint, method_part = selection.split(" | ")
-                        method = method_part.split(" - ")[0].lower()
-                    else:
-                        endpoint = selection
-                        method = "get"
+    # Serialize runs for the same session across worker processes
+    with backend.lock(session_id):
+        # Process selected endpoints
+        for selections in checkbox_values:
+            if isinstance(selections, list):
+                for selection in selections:
+                    try:
+                        if " | " in selection:
+                            endpoint, method_part = selection.split(" | ")
+                            method = method_part.split(" - ")[0].lower()
+                        else:
+                            endpoint = selection
+                            method = "get"
                     
-                    # Ensure endpoint starts with /api/v1
-                    if not endpoint.startswith('/api/v1'):
-                        endpoint = f"/api/v1{endpoint}"
+                        # Parameters entered for this endpoint only
+                        endpoint_params = param_values.get(endpoint, {})
                     
-                    # Handle parameter replacement if needed
-                    if any(char in endpoint for char in ['{', '}']):
-                        full_url, error = handle_path_parameters(endpoint, api_base_url, param_values)
-                        if error:
-                            responses[endpoint] = f"Error: {error}"
-                            continue
-                    else:
-                        full_url = f"{api_base_url.rstrip('/')}{endpoint}"
+                        # Ensure endpoint starts with /api/v1
+                        if not endpoint.startswith('/api/v1'):
+                            endpoint = f"/api/v1{endpoint}"
                     
-                    print(f"Calling Okta endpoint: {full_url}")
+                        # Handle parameter replacement if needed
+                        if any(char in endpoint for char in ['{', '}']):
+                            full_url, error = handle_path_parameters(endpoint, api_base_url, endpoint_params.get("path", {}))
+                            if error:
+                                responses[endpoint] = f"Error: {error}"
+                                continue
+                        else:
+                            full_url = f"{api_base_url.rstrip('/')}{endpoint}"
                     
-                    r = requests.get(full_url, headers=headers)
-                    r.raise_for_status()
+                        print(f"Calling Okta endpoint: {full_url}")
                     
-                    data = r.json() if r.headers.get('content-type', '').startswith('application/json') else r.text
-                    responses[endpoint] = data
+                        data = fetch_endpoint(
+                            full_url,
+                            "Okta",
+                            api_base_url.rstrip("/"),
+                            endpoint,
+                            params=endpoint_params.get("query"),
+                            paged=endpoint_params.get("paged", False),
+                            headers=headers
+                        )
+                        responses[endpoint] = data
                     
-                    # Save response data
-                    save_response_data(data, endpoint, base_save_folder)
-                        
-                except Exception as e:
-                    responses[endpoint] = f"Error: {traceback.format_exc()}"
+                        # Save response data
+                        save_response_data(data, endpoint, base_save_folder)
+                    except Exception as e:
+                        responses[endpoint] = f"Error: {traceback.format_exc()}"
+                        continue
+                    
+                    # A store failure must not mark an already saved response as failed
+                    try:
+                        ingest_response(data, api_base_url.rstrip("/"), endpoint, session_id)
+                    except Exception as e:
+                        print(f"Error storing {endpoint} in identity store: {e}")
     
-    # Create and return session zip
-    zip_filename = create_session_zip(session_id)
-    return responses, zip_filename, session_id, "✅ Okta API calls complete!"
+        # Write the profile first so it is part of the archive
+        finish_profile()
 
-# Include save_response_data and create_session_zip functions (same as IdentityNow)
\ No newline at end of file
+        # Create and return session zip
+        zip_filename = create_session_zip(session_id, backend)
+    
+    return responses, zip_filename, session_id, "✅ Okta API calls complete!"
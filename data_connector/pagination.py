@@ -0,0 +1,185 @@
+import os
+import time
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+from coalesce import coalesced_get
+from store import load_page_size, save_page_size
+from profiling import span
+
+# Vendor pagination conventions and maximum page sizes
+VENDOR_PAGING = {
+    "IdentityNow": {"size_param": "limit", "max": 250, "offset_param": "offset", "start": 0, "count_param": "count"},
+    "Okta": {"size_param": "limit", "max": 200, "cursor": "link"},
+    "IIQ": {"size_param": "count", "max": 1000, "offset_param": "startIndex", "start": 1, "items_key": "Resources"}
+}
+MIN_PAGE_SIZE = 10
+
+def target_page_seconds():
+    """Latency the page size is tuned towards (TARGET_PAGE_SECONDS)"""
+    return float(os.getenv("TARGET_PAGE_SECONDS", "2"))
+
+def max_page_bytes():
+    """Upper bound on the estimated size of one page (MAX_PAGE_BYTES)"""
+    return int(os.getenv("MAX_PAGE_BYTES", str(5 * 1024 * 1024)))
+
+def declares_param(spec_params, name):
+    """Whether an endpoint spec declares a parameter, inline or via $ref"""
+    for param in spec_params or []:
+        if not isinstance(param, dict):
+            continue
+        if param.get("name") == name:
+            return True
+        ref = param.get("$ref", "")
+        if ref and ref.rsplit("/", 1)[-1].split(".")[0].lower() == name.lower():
+            return True
+    return False
+
+class PageSizeTuner:
+    """Adjusts the page size of one (tenant, endpoint) from observed latency and payload size"""
+
+    def __init__(self, tenant, endpoint, max_size):
+        self.tenant = tenant
+        self.endpoint = endpoint
+        self.max_size = max_size
+        self.bytes_per_record = None
+        remembered = load_page_size(tenant, endpoint)
+        if remembered:
+            page_size, self.bytes_per_record = remembered
+        else:
+            page_size = max_size // 2
+        self.page_size = self.clamp(page_size)
+
+    def clamp(self, size):
+        upper = self.max_size
+        if self.bytes_per_record:
+            upper = min(upper, int(max_page_bytes() / self.bytes_per_record))
+        return max(min(MIN_PAGE_SIZE, self.max_size), min(upper, int(size)))
+
+    def cap(self, size):
+        """The server returned at most `size` records for a larger page; never ask for more"""
+        self.max_size = min(self.max_size, size)
+        self.page_size = self.clamp(self.page_size)
+
+    def observe(self, records, size_bytes, seconds):
+        """Record one page and pick the next page size"""
+        if not records:
+            return
+        per_record = size_bytes / records
+        if self.bytes_per_record is None:
+            self.bytes_per_record = per_record
+        else:
+            self.bytes_per_record = 0.7 * self.bytes_per_record + 0.3 * per_record
+        # Short pages say nothing about how a full page would perform
+        if records < self.page_size or seconds <= 0:
+            self.page_size = self.clamp(self.page_size)
+            return
+        factor = min(2.0, max(0.5, target_page_seconds() / seconds))
+        self.page_size = self.clamp(self.page_size * factor)
+
+    def save(self):
+        save_page_size(self.tenant, self.endpoint, self.page_size, self.bytes_per_record)
+
+def with_query_param(url, name, value):
+    """Replace one query parameter of a URL"""
+    parts = urlsplit(url)
+    query = [(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if k != name]
+    query.append((name, str(value)))
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+def parse_response(r):
+    return r.json() if r.headers.get('content-type', '').startswith('application/json') else r.text
+
+def fetch_endpoint(full_url, vendor, tenant, endpoint, params=None, paged=False, **get_kwargs):
+    """Fetch an endpoint, following pagination with a tuned page size when `paged`.
+
+    Pagination is skipped when the caller set the page size or offset
+    explicitly. Pages are combined into a single list (IIQ keeps its SCIM
+    envelope with the combined Resources).
+    """
+    params = dict(params or {})
+    paging = VENDOR_PAGING[vendor]
+    if not paged or paging["size_param"] in params or paging.get("offset_param") in params:
+        with span("fetch"):
+            r = coalesced_get(full_url, params=params or None, **get_kwargs)
+        r.raise_for_status()
+        with span("parse"):
+            return parse_response(r)
+
+    tuner = PageSizeTuner(tenant, endpoint, paging["max"])
+    items_key = paging.get("items_key")
+    envelope = None
+    items = []
+    previous_first = None
+    offset = paging.get("start", 0)
+    next_url = full_url
+    first_page = True
+    short_page = None
+
+    while next_url:
+        requested = tuner.page_size
+        if paging.get("cursor") == "link":
+            if first_page:
+                page_params = {**params, paging["size_param"]: requested}
+            else:
+                # The next link carries the cursor and original query
+                next_url = with_query_param(next_url, paging["size_param"], requested)
+                page_params = None
+        else:
+            page_params = {**params, paging["size_param"]: requested, paging["offset_param"]: offset}
+            if paging.get("count_param") and paging["count_param"] not in params:
+                # Ask for the total (X-Total-Count) so the last page needs no extra request
+                page_params[paging["count_param"]] = "true"
+
+        started = time.monotonic()
+        with span("fetch"):
+            r = coalesced_get(next_url, params=page_params, **get_kwargs)
+        elapsed = time.monotonic() - started
+        r.raise_for_status()
+        with span("parse"):
+            body = parse_response(r)
+
+        page = body.get(items_key) if items_key and isinstance(body, dict) else body
+        if not isinstance(page, list):
+            if first_page:
+                # Not a collection after all, return it as is
+                return body
+            raise ValueError(f"Unexpected non-list page while paging {endpoint}")
+        first_page = False
+        if envelope is None:
+            envelope = body
+        tuner.observe(len(page), len(r.content), elapsed)
+
+        # Stop when the server ignores paging and repeats or over-fills a page
+        if page and previous_first is not None and page[0] == previous_first:
+            break
+        previous_first = page[0] if page else None
+        items.extend(page)
+
+        # A short page followed by more records means the server caps the page size
+        if page and short_page:
+            tuner.cap(short_page)
+        short_page = len(page) if 0 < len(page) < requested else None
+
+        if paging.get("cursor") == "link":
+            next_url = r.links.get("next", {}).get("url")
+            continue
+        offset += len(page)
+        if isinstance(body, dict) and body.get("totalResults") is not None:
+            total = int(body["totalResults"])
+        elif r.headers.get("X-Total-Count") is not None:
+            total = int(r.headers["X-Total-Count"])
+        else:
+            total = None
+        if not page:
+            next_url = None
+        elif total is not None:
+            next_url = next_url if len(items) < total else None
+        # Without a total only an empty page proves the collection is exhausted
+
+    tuner.save()
+    if items_key and isinstance(envelope, dict):
+        envelope = dict(envelope)
+        envelope[items_key] = items
+        envelope["itemsPerPage"] = len(items)
+        envelope["startIndex"] = paging.get("start", 1)
+        return envelope
+    return items
@@ -0,0 +1,182 @@
+import os
+import sys
+import json
+import time
+import pstats
+import cProfile
+import datetime
+import functools
+import threading
+import contextlib
+import contextvars
+from collections import Counter
+
+PROFILE_MODES = ["off", "spans", "cprofile", "sample"]
+
+_current_run = contextvars.ContextVar("profile_run", default=None)
+
+def default_mode():
+    """Profiling mode from PROFILE_MODE (off, spans, cprofile or sample)"""
+    mode = os.getenv("PROFILE_MODE", "off").lower()
+    return mode if mode in PROFILE_MODES else "off"
+
+def sample_interval():
+    """Seconds between stack samples in "sample" mode (PROFILE_SAMPLE_INTERVAL)"""
+    return float(os.getenv("PROFILE_SAMPLE_INTERVAL", "0.005"))
+
+class _Recorder:
+    """Collects nested timing spans for one profiled run"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stack = []
+        self.spans = []
+        self.self_time = Counter()
+
+    def push(self, name):
+        self.stack.append([name, time.perf_counter(), 0.0])
+
+    def pop(self):
+        name, start, child_time = self.stack.pop()
+        duration = time.perf_counter() - start
+        path = ";".join([frame[0] for frame in self.stack] + [name])
+        self.spans.append({
+            "name": name,
+            "path": path,
+            "start": round(start - self.started, 6),
+            "duration": round(duration, 6)
+        })
+        self.self_time[path] += duration - child_time
+        if self.stack:
+            self.stack[-1][2] += duration
+
+class _Sampler(threading.Thread):
+    """Samples the call stack of one thread into folded-stack counts"""
+
+    def __init__(self, thread_id, interval):
+        super().__init__(name="profile-sampler", daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            frames = []
+            while frame is not None:
+                code = frame.f_code
+                frames.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            if frames:
+                self.stacks[";".join(reversed(frames))] += 1
+
+@contextlib.contextmanager
+def span(name):
+    """Time a pipeline stage; does nothing unless a profiled run is active"""
+    run = _current_run.get()
+    if run is None:
+        yield
+        return
+    run.recorder.push(name)
+    try:
+        yield
+    finally:
+        run.recorder.pop()
+
+def timed(name):
+    """Decorator form of `span`"""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def _write_folded(path, counts, scale=1):
+    with open(path, "w", encoding="utf-8") as f:
+        for stack, value in sorted(counts.items()):
+            count = int(round(value * scale))
+            if count > 0:
+                f.write(f"{stack} {count}\n")
+
+class _ProfileRun:
+    """Profilers of one run; `finish` stops them and writes the output once"""
+
+    def __init__(self, session_dir, mode):
+        self.session_dir = session_dir
+        self.mode = mode
+        self.recorder = _Recorder()
+        self.profiler = cProfile.Profile() if mode == "cprofile" else None
+        self.sampler = _Sampler(threading.get_ident(), sample_interval()) if mode == "sample" else None
+        self.token = None
+        self.finished = False
+
+    def start(self):
+        self.token = _current_run.set(self)
+        if self.profiler:
+            self.profiler.enable()
+        if self.sampler:
+            self.sampler.start()
+        self.recorder.push("run")
+
+    def finish(self):
+        if self.finished:
+            return
+        self.finished = True
+        self.recorder.pop()
+        if self.profiler:
+            self.profiler.disable()
+        if self.sampler:
+            self.sampler.stopped.set()
+            self.sampler.join()
+        _current_run.reset(self.token)
+        # Profiling is best effort and must never mask the run's own result or error
+        try:
+            self.write()
+        except Exception as e:
+            print(f"Failed to write profile: {e}")
+
+    def write(self):
+        timestamp = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S-%f")
+        out_dir = os.path.join(self.session_dir, "profile", timestamp)
+        os.makedirs(out_dir, exist_ok=True)
+        with open(os.path.join(out_dir, "spans.json"), "w", encoding="utf-8") as f:
+            json.dump({"mode": self.mode, "spans": self.recorder.spans}, f, indent=2)
+        _write_folded(os.path.join(out_dir, "spans.folded"), self.recorder.self_time, scale=1_000_000)
+        if self.profiler:
+            self.profiler.dump_stats(os.path.join(out_dir, "profile.prof"))
+            with open(os.path.join(out_dir, "profile.txt"), "w", encoding="utf-8") as f:
+                pstats.Stats(self.profiler, stream=f).sort_stats("cumulative").print_stats(50)
+        if self.sampler:
+            _write_folded(os.path.join(out_dir, "stacks.folded"), self.sampler.stacks)
+        print(f"Profile written to {out_dir}")
+
+def finish_profile():
+    """Stop the active profiled run early and write its output, e.g. before archiving the session"""
+    run = _current_run.get()
+    if run is not None:
+        run.finish()
+
+@contextlib.contextmanager
+def profile_run(session_dir, mode=None):
+    """Profile the enclosed run and write the results under <session_dir>/profile/<timestamp>/.
+
+    Every mode other than "off" writes spans.json and spans.folded (span
+    self-time in microseconds). "cprofile" adds profile.prof, and "sample"
+    adds stacks.folded; both folded files can be fed to flamegraph.pl or
+    speedscope. Output is written when the block exits unless
+    `finish_profile` was called first.
+    """
+    mode = (mode or default_mode()).lower()
+    if mode not in PROFILE_MODES or mode == "off" or _current_run.get() is not None:
+        yield
+        return
+
+    run = _ProfileRun(session_dir, mode)
+    run.start()
+    try:
+        yield
+    finally:
+        run.finish()
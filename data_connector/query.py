@@ -0,0 +1,318 @@
+import os
+import re
+import sys
+import gzip
+import json
+import hashlib
+import argparse
+
+SNAPSHOT_PATTERN = re.compile(r"^(?P<name>.+) \((?P<timestamp>\d{4}-\d{2}-\d{2}_\d{2}-\d{2}-\d{2})\)$")
+SEGMENT_SUFFIX = ".jsonl.gz"
+INDEX_SUFFIX = ".index.json"
+
+def parse_line(line, source=None, offset=None):
+    """Parse one JSONL line; unparsable lines (e.g. saved non-JSON responses) are reported and skipped"""
+    try:
+        return json.loads(line)
+    except ValueError:
+        print(f"Skipping unparsable line at offset {offset} in {source}", file=sys.stderr)
+        return None
+
+def _record_or_text(line):
+    """Parsed record, or the raw text of a line that is not JSON"""
+    try:
+        return json.loads(line)
+    except ValueError:
+        return line.decode("utf-8", errors="replace").rstrip("\r\n")
+
+class JsonlFile:
+    """Streaming view over a JSONL file.
+
+    Records are addressed by the byte offset of their line, as yielded by
+    iter_lines, so individual records can be read back without loading
+    the whole file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def read_at(self, offset):
+        """Read and parse the record starting at a byte offset"""
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            return _record_or_text(f.readline())
+
+    def read_many(self, offsets):
+        """Read the records at several byte offsets with one open file; returns {offset: record}"""
+        records = {}
+        with open(self.path, "rb") as f:
+            for offset in sorted(set(offsets)):
+                f.seek(offset)
+                records[offset] = _record_or_text(f.readline())
+        return records
+
+    def iter_lines(self):
+        """Yield (offset, raw line) pairs, streaming through the file"""
+        with open(self.path, "rb") as f:
+            offset = 0
+            for line in f:
+                if line.strip():
+                    yield offset, line
+                offset += len(line)
+
+    def __iter__(self):
+        for offset, line in self.iter_lines():
+            record = parse_line(line, self.path, offset)
+            if record is not None:
+                yield record
+
+class SegmentSnapshot:
+    """One snapshot stored as a gzip member of a compacted endpoint segment.
+
+    Offsets are positions in the decompressed snapshot, so they can be used
+    with read_at just like JsonlFile offsets.
+    """
+
+    def __init__(self, path, offset, length):
+        self.path = path
+        self.offset = offset
+        self.length = length
+
+    def _open(self):
+        f = open(self.path, "rb")
+        f.seek(self.offset)
+        return f, gzip.GzipFile(fileobj=_BoundedReader(f, self.length), mode="rb")
+
+    def iter_lines(self):
+        f, member = self._open()
+        with f, member:
+            offset = 0
+            for line in member:
+                if line.strip():
+                    yield offset, line
+                offset += len(line)
+
+    def read_at(self, offset):
+        records = self.read_many([offset])
+        if offset not in records:
+            raise IndexError(offset)
+        return records[offset]
+
+    def read_many(self, offsets):
+        """Read the records at several offsets in one decompression pass; returns {offset: record}"""
+        wanted = set(offsets)
+        records = {}
+        if not wanted:
+            return records
+        for line_offset, line in self.iter_lines():
+            if line_offset in wanted:
+                records[line_offset] = _record_or_text(line)
+                if len(records) == len(wanted):
+                    break
+        return records
+
+    def __iter__(self):
+        for offset, line in self.iter_lines():
+            record = parse_line(line, self.path, offset)
+            if record is not None:
+                yield record
+
+class _BoundedReader:
+    """File wrapper that stops reading after `length` bytes"""
+
+    def __init__(self, f, length):
+        self.f = f
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.f.read(size)
+        self.remaining -= len(data)
+        return data
+
+def read_segment_index(segment_path):
+    """Load the snapshot index written next to a compacted segment"""
+    try:
+        with open(segment_path[:-len(SEGMENT_SUFFIX)] + INDEX_SUFFIX, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return []
+
+def open_snapshot(snapshot):
+    """Open a snapshot from list_snapshots (or a plain JSONL path)"""
+    if isinstance(snapshot, str):
+        return JsonlFile(snapshot)
+    if "offset" in snapshot:
+        return SegmentSnapshot(snapshot["path"], snapshot["offset"], snapshot["length"])
+    return JsonlFile(snapshot["path"])
+
+def list_snapshots(session_folders, endpoint=None):
+    """List endpoint snapshots stored in one or more session folders, oldest first"""
+    wanted = endpoint.strip("/").replace("/", "_") if endpoint else None
+    snapshots = []
+    for session_folder in session_folders:
+        for root, dirs, files in os.walk(session_folder):
+            for file in files:
+                if not file.endswith(SEGMENT_SUFFIX):
+                    continue
+                name = file[:-len(SEGMENT_SUFFIX)]
+                if wanted and name != wanted:
+                    continue
+                path = os.path.join(root, file)
+                for item in read_segment_index(path):
+                    snapshots.append({
+                        "endpoint": name,
+                        "timestamp": item["timestamp"],
+                        "vendor": os.path.basename(root),
+                        "path": path,
+                        "offset": item["offset"],
+                        "length": item["length"]
+                    })
+            match = SNAPSHOT_PATTERN.match(os.path.basename(root))
+            if not match or "data.jsonl" not in files:
+                continue
+            if wanted and match.group("name") != wanted:
+                continue
+            snapshots.append({
+                "endpoint": match.group("name"),
+                "timestamp": match.group("timestamp"),
+                "vendor": os.path.basename(os.path.dirname(root)),
+                "path": os.path.join(root, "data.jsonl")
+            })
+    snapshots.sort(key=lambda s: s["timestamp"])
+    return snapshots
+
+def get_field(record, field):
+    """Resolve a dotted field path such as 'attributes.name'"""
+    value = record
+    for part in field.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value
+
+def parse_where(expressions):
+    """Parse 'field=value' expressions into (field, value) pairs"""
+    conditions = []
+    for expression in expressions or []:
+        if "=" not in expression:
+            raise ValueError(f"Invalid filter '{expression}', expected field=value")
+        field, value = expression.split("=", 1)
+        conditions.append((field.strip(), value))
+    return conditions
+
+def filter_records(records, conditions):
+    """Yield records whose fields match every (field, value) condition"""
+    for record in records:
+        if all(str(get_field(record, field)) == value for field, value in conditions):
+            yield record
+
+def project_records(records, fields):
+    """Yield records reduced to the given (dotted) fields"""
+    for record in records:
+        yield {field: get_field(record, field) for field in fields}
+
+def _line_key(line, key):
+    try:
+        record = json.loads(line)
+    except ValueError:
+        record = None  # non-JSON lines are keyed by their content hash
+    object_id = get_field(record, key) if isinstance(record, dict) else None
+    digest = hashlib.sha256(line.rstrip(b"\r\n")).hexdigest()
+    return (str(object_id) if object_id is not None else digest), digest
+
+def diff_snapshots(old, new, key="id"):
+    """Compare two snapshots of an endpoint by object key.
+
+    `old` and `new` are snapshots from list_snapshots or JSONL paths. Only
+    keys, hashes and offsets are held in memory; the full records can be
+    read back from the returned offsets via read_many.
+    """
+    old_index = {}
+    for offset, line in open_snapshot(old).iter_lines():
+        object_id, digest = _line_key(line, key)
+        old_index[object_id] = (offset, digest)
+
+    added, changed = [], []
+    for offset, line in open_snapshot(new).iter_lines():
+        object_id, digest = _line_key(line, key)
+        previous = old_index.pop(object_id, None)
+        if previous is None:
+            added.append((object_id, offset))
+        elif previous[1] != digest:
+            changed.append((object_id, previous[0], offset))
+    removed = [(object_id, offset) for object_id, (offset, _) in old_index.items()]
+    return {"added": added, "removed": removed, "changed": changed}
+
+def _snapshot_records(args):
+    snapshots = list_snapshots(args.sessions, args.endpoint)
+    if not snapshots:
+        raise SystemExit(f"No snapshots found for endpoint '{args.endpoint}'")
+    return open_snapshot(snapshots[-1])
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Query stored session data")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    snapshots_cmd = commands.add_parser("snapshots", help="List endpoint snapshots")
+    snapshots_cmd.add_argument("sessions", nargs="+", help="Session folders")
+    snapshots_cmd.add_argument("--endpoint")
+
+    select_cmd = commands.add_parser("select", help="Filter and project the latest snapshot of an endpoint")
+    select_cmd.add_argument("sessions", nargs="+", help="Session folders")
+    select_cmd.add_argument("--endpoint", required=True)
+    select_cmd.add_argument("--where", action="append", help="field=value filter, may be repeated")
+    select_cmd.add_argument("--fields", help="Comma-separated fields to project")
+    select_cmd.add_argument("--count", action="store_true", help="Only print the number of matches")
+
+    diff_cmd = commands.add_parser("diff", help="Diff the two latest snapshots of an endpoint")
+    diff_cmd.add_argument("sessions", nargs="+", help="Session folders")
+    diff_cmd.add_argument("--endpoint", required=True)
+    diff_cmd.add_argument("--key", default="id")
+    diff_cmd.add_argument("--since", help="Compare against the latest snapshot at or before this timestamp (YYYY-MM-DD_HH-MM-SS)")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "snapshots":
+        for snapshot in list_snapshots(args.sessions, args.endpoint):
+            print(json.dumps(snapshot))
+    elif args.command == "select":
+        records = filter_records(_snapshot_records(args), parse_where(args.where))
+        if args.count:
+            print(sum(1 for _ in records))
+            return
+        if args.fields:
+            records = project_records(records, [f.strip() for f in args.fields.split(",")])
+        for record in records:
+            print(json.dumps(record))
+    elif args.command == "diff":
+        snapshots = list_snapshots(args.sessions, args.endpoint)
+        if args.since:
+            older = [s for s in snapshots if s["timestamp"] <= args.since]
+            if not older:
+                raise SystemExit(f"No snapshot of '{args.endpoint}' at or before {args.since}")
+            old = older[-1]
+            if old is snapshots[-1]:
+                raise SystemExit(
+                    f"The latest snapshot of '{args.endpoint}' ({old['timestamp']}) is not newer than {args.since}; nothing to diff"
+                )
+        elif len(snapshots) >= 2:
+            old = snapshots[-2]
+        else:
+            raise SystemExit(f"Need at least two snapshots of '{args.endpoint}' to diff")
+        new = snapshots[-1]
+        result = diff_snapshots(old, new, args.key)
+        # Fetch every needed record in a single pass over the new snapshot
+        records = open_snapshot(new).read_many(
+            [offset for _, offset in result["added"]] + [offset for _, _, offset in result["changed"]]
+        )
+        for object_id, offset in result["added"]:
+            print(json.dumps({"change": "added", "id": object_id, "record": records[offset]}))
+        for object_id, _ in result["removed"]:
+            print(json.dumps({"change": "removed", "id": object_id}))
+        for object_id, _, offset in result["changed"]:
+            print(json.dumps({"change": "changed", "id": object_id, "record": records[offset]}))
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,193 @@
+import os
+import json
+import gzip
+import time
+import shutil
+import datetime
+import threading
+from backends import atomic_write, get_backend
+from query import SNAPSHOT_PATTERN, SEGMENT_SUFFIX, INDEX_SUFFIX, read_segment_index
+
+SWEEPER_LOCK = "__retention_sweeper__"
+TIMESTAMP_FORMAT = "%Y-%m-%d_%H-%M-%S"
+
+def retention_policy():
+    """Read the retention policy from the environment (0 disables a limit)"""
+    return {
+        "max_age_days": float(os.getenv("RETENTION_MAX_AGE_DAYS", "0")),
+        "max_total_bytes": int(os.getenv("RETENTION_MAX_BYTES", "0")),
+        "compact_after_minutes": float(os.getenv("RETENTION_COMPACT_AFTER_MINUTES", "60"))
+    }
+
+def folder_size(path):
+    total = 0
+    for root, dirs, files in os.walk(path):
+        for file in files:
+            try:
+                total += os.path.getsize(os.path.join(root, file))
+            except FileNotFoundError:
+                pass
+    return total
+
+def last_activity(session_dir):
+    """Timestamp of the newest snapshot in a session, raw or compacted.
+
+    Snapshot timestamps are used rather than mtimes so compaction does not
+    make a session look recently used.
+    """
+    timestamps = []
+    for vendor in os.scandir(session_dir):
+        if not vendor.is_dir():
+            continue
+        for entry in os.scandir(vendor.path):
+            match = SNAPSHOT_PATTERN.match(entry.name)
+            if match:
+                timestamps.append(match.group("timestamp"))
+            elif entry.name.endswith(SEGMENT_SUFFIX):
+                timestamps.extend(item["timestamp"] for item in read_segment_index(entry.path))
+    if not timestamps:
+        return os.path.getmtime(session_dir)
+    return datetime.datetime.strptime(max(timestamps), TIMESTAMP_FORMAT).timestamp()
+
+def list_sessions(backend):
+    """Return [(session_id, last activity, size in bytes)] oldest first.
+
+    Sessions are the union of raw data folders and sessions that only have
+    saved state or artifacts (e.g. a user who browsed but never called an API).
+    """
+    stored = backend.stored_sessions()
+    sessions_root = os.path.join(backend.root, "sessions")
+    session_ids = set(stored)
+    if os.path.isdir(sessions_root):
+        session_ids.update(entry.name for entry in os.scandir(sessions_root) if entry.is_dir())
+
+    sessions = []
+    for session_id in session_ids:
+        session_dir = backend.session_dir(session_id)
+        if os.path.isdir(session_dir):
+            last_active = max(last_activity(session_dir), stored.get(session_id, 0))
+            size = folder_size(session_dir)
+        else:
+            last_active, size = stored[session_id], 0
+        sessions.append((session_id, last_active, size))
+    sessions.sort(key=lambda s: s[1])
+    return sessions
+
+def compact_vendor_folder(vendor_folder, older_than):
+    """Merge timestamped '<endpoint> (<timestamp>)' folders into one segment per endpoint.
+
+    Each snapshot becomes one gzip member appended to '<endpoint>.jsonl.gz';
+    '<endpoint>.index.json' records each member's timestamp, offset and length
+    so single snapshots stay readable. Returns the number of folders merged.
+    """
+    snapshots = {}
+    for entry in os.scandir(vendor_folder):
+        match = SNAPSHOT_PATTERN.match(entry.name)
+        data_file = os.path.join(entry.path, "data.jsonl")
+        if not entry.is_dir() or not match or not os.path.exists(data_file):
+            continue
+        if os.path.getmtime(data_file) > older_than:
+            continue
+        snapshots.setdefault(match.group("name"), []).append((match.group("timestamp"), entry.path, data_file))
+
+    merged = 0
+    for name, entries in snapshots.items():
+        segment_path = os.path.join(vendor_folder, name + SEGMENT_SUFFIX)
+        index = read_segment_index(segment_path)
+        # Folders already in the index were merged by a run that died before
+        # removing them; appending them again would duplicate the snapshot
+        indexed = {item["timestamp"] for item in index}
+        with open(segment_path, "ab") as segment:
+            for timestamp, folder, data_file in sorted(entries):
+                if timestamp in indexed:
+                    continue
+                offset = segment.tell()
+                with open(data_file, "rb") as src, gzip.GzipFile(fileobj=segment, mode="wb", mtime=0) as member:
+                    shutil.copyfileobj(src, member)
+                index.append({"timestamp": timestamp, "offset": offset, "length": segment.tell() - offset})
+            segment.flush()
+            os.fsync(segment.fileno())
+        index.sort(key=lambda item: item["timestamp"])
+        atomic_write(segment_path[:-len(SEGMENT_SUFFIX)] + INDEX_SUFFIX, json.dumps(index).encode("utf-8"))
+        for _, folder, _ in entries:
+            shutil.rmtree(folder, ignore_errors=True)
+        merged += len(entries)
+    return merged
+
+def compact_session(backend, session_id, older_than):
+    """Compact every vendor folder of a session while holding its lock"""
+    session_dir = backend.session_dir(session_id)
+    merged = 0
+    if not os.path.isdir(session_dir):
+        return 0
+    with backend.lock(session_id, timeout=0):
+        for entry in os.scandir(session_dir):
+            if entry.is_dir():
+                merged += compact_vendor_folder(entry.path, older_than)
+    return merged
+
+def evict_session(backend, session_id):
+    """Remove a session's data, state and artifacts"""
+    with backend.lock(session_id, timeout=0):
+        backend.delete_session(session_id)
+
+def sweep(backend=None, policy=None):
+    """Apply compaction and age/size eviction once. Busy sessions are skipped."""
+    backend = backend or get_backend()
+    policy = policy or retention_policy()
+    now = time.time()
+    stats = {"compacted": 0, "evicted": 0, "skipped": 0}
+
+    sessions = list_sessions(backend)
+    survivors = []
+    for session_id, last_active, size in sessions:
+        try:
+            if policy["max_age_days"] and now - last_active > policy["max_age_days"] * 86400:
+                evict_session(backend, session_id)
+                stats["evicted"] += 1
+                continue
+            if policy["compact_after_minutes"]:
+                older_than = now - policy["compact_after_minutes"] * 60
+                if compact_session(backend, session_id, older_than):
+                    stats["compacted"] += 1
+                    size = folder_size(backend.session_dir(session_id))
+            survivors.append((session_id, size))
+        except TimeoutError:
+            stats["skipped"] += 1
+
+    # Size-based eviction removes the oldest sessions first
+    if policy["max_total_bytes"]:
+        total = sum(size for _, size in survivors)
+        for session_id, size in survivors:
+            if total <= policy["max_total_bytes"]:
+                break
+            try:
+                evict_session(backend, session_id)
+                stats["evicted"] += 1
+                total -= size
+            except TimeoutError:
+                stats["skipped"] += 1
+    return stats
+
+def start_sweeper(interval, backend=None):
+    """Run `sweep` every `interval` seconds in a daemon thread.
+
+    Only one worker sharing the backend sweeps at a time.
+    """
+    backend = backend or get_backend()
+
+    def run():
+        while True:
+            try:
+                with backend.lock(SWEEPER_LOCK, timeout=0):
+                    stats = sweep(backend)
+                print(f"Retention sweep: {stats}")
+            except TimeoutError:
+                pass
+            except Exception as e:
+                print(f"Retention sweep failed: {e}")
+            time.sleep(interval)
+
+    thread = threading.Thread(target=run, name="retention-sweeper", daemon=True)
+    thread.start()
+    return thread
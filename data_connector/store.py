@@ -0,0 +1,220 @@
+import os
+import sys
+import json
+import sqlite3
+import hashlib
+import argparse
+import datetime
+import config  # loads .env when run as a script
+from profiling import timed
+
+DEFAULT_KEY_FIELD = "id"
+
+def store_path():
+    """Location of the identity store database (IDENTITY_STORE_PATH, default under DATA_ROOT)"""
+    return os.getenv("IDENTITY_STORE_PATH", os.path.join(os.getenv("DATA_ROOT", "."), "identity_store.db"))
+
+def key_field(endpoint):
+    """Field that identifies an object of an endpoint.
+
+    Defaults to "id"; IDENTITY_STORE_KEYS overrides it per endpoint as
+    comma-separated endpoint=field pairs, e.g. "/v3/sources=name". Dotted
+    fields such as "profile.login" are supported.
+    """
+    for pair in os.getenv("IDENTITY_STORE_KEYS", "").split(","):
+        name, _, field = pair.partition("=")
+        if field and name.strip() == endpoint:
+            return field.strip()
+    return DEFAULT_KEY_FIELD
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS records (
+    tenant TEXT NOT NULL,
+    endpoint TEXT NOT NULL,
+    object_id TEXT NOT NULL,
+    content_hash TEXT NOT NULL,
+    data TEXT NOT NULL,
+    first_seen TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    session_id TEXT,
+    PRIMARY KEY (tenant, endpoint, object_id)
+);
+CREATE INDEX IF NOT EXISTS idx_records_updated
+    ON records (tenant, endpoint, updated_at);
+CREATE TABLE IF NOT EXISTS page_sizes (
+    tenant TEXT NOT NULL,
+    endpoint TEXT NOT NULL,
+    page_size INTEGER NOT NULL,
+    bytes_per_record REAL,
+    updated_at TEXT NOT NULL,
+    PRIMARY KEY (tenant, endpoint)
+);
+"""
+
+def open_store(path=None):
+    """Open (and create if needed) the persistent identity store"""
+    path = path or store_path()
+    folder = os.path.dirname(path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+def content_hash(record):
+    """Stable hash of a record's content, independent of key order"""
+    canonical = json.dumps(record, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+def record_id(record, key=DEFAULT_KEY_FIELD):
+    """Object id of a record, or None when it has no stable key"""
+    value = record
+    for part in key.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    if value in (None, "") or isinstance(value, (dict, list)):
+        return None
+    return str(value)
+
+def upsert_records(conn, tenant, endpoint, data, session_id=None, items_key=None):
+    """Upsert API response records, skipping ones whose content is unchanged.
+
+    `items_key` names the list inside an envelope response (e.g. SCIM
+    "Resources") whose items are the actual records.
+    Records are keyed by the endpoint's `key_field`; records without that
+    key are skipped, since they could not be matched to their next version.
+    Returns a dict with the number of inserted, updated, unchanged and
+    skipped records.
+    """
+    stats = {"inserted": 0, "updated": 0, "unchanged": 0, "skipped": 0}
+    if items_key and isinstance(data, dict) and isinstance(data.get(items_key), list):
+        records = data[items_key]
+    elif isinstance(data, dict):
+        records = [data]
+    elif isinstance(data, list):
+        records = data
+    else:
+        return stats
+
+    key = key_field(endpoint)
+    now = datetime.datetime.now(datetime.timezone.utc).isoformat()
+    with conn:
+        for record in records:
+            object_id = record_id(record, key)
+            if object_id is None:
+                stats["skipped"] += 1
+                continue
+            digest = content_hash(record)
+            row = conn.execute(
+                "SELECT content_hash FROM records WHERE tenant = ? AND endpoint = ? AND object_id = ?",
+                (tenant, endpoint, object_id)
+            ).fetchone()
+            if row is None:
+                conn.execute(
+                    "INSERT INTO records (tenant, endpoint, object_id, content_hash, data, first_seen, updated_at, session_id) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (tenant, endpoint, object_id, digest, json.dumps(record), now, now, session_id)
+                )
+                stats["inserted"] += 1
+            elif row["content_hash"] != digest:
+                conn.execute(
+                    "UPDATE records SET content_hash = ?, data = ?, updated_at = ?, session_id = ? "
+                    "WHERE tenant = ? AND endpoint = ? AND object_id = ?",
+                    (digest, json.dumps(record), now, session_id, tenant, endpoint, object_id)
+                )
+                stats["updated"] += 1
+            else:
+                stats["unchanged"] += 1
+    if stats["skipped"]:
+        print(f"Skipped {stats['skipped']} {endpoint} records without a '{key}' key; set IDENTITY_STORE_KEYS to store them")
+    return stats
+
+def get_record(conn, tenant, endpoint, object_id):
+    """Return the latest stored version of an object, or None"""
+    row = conn.execute(
+        "SELECT data FROM records WHERE tenant = ? AND endpoint = ? AND object_id = ?",
+        (tenant, endpoint, str(object_id))
+    ).fetchone()
+    return json.loads(row["data"]) if row else None
+
+def changed_since(conn, tenant, endpoint, since):
+    """Yield (object_id, updated_at, record) for objects changed after `since` (ISO timestamp)"""
+    if isinstance(since, datetime.datetime):
+        since = since.isoformat()
+    cursor = conn.execute(
+        "SELECT object_id, updated_at, data FROM records "
+        "WHERE tenant = ? AND endpoint = ? AND updated_at > ? ORDER BY updated_at",
+        (tenant, endpoint, since)
+    )
+    for row in cursor:
+        yield row["object_id"], row["updated_at"], json.loads(row["data"])
+
+@timed("store")
+def ingest_response(data, tenant, endpoint, session_id=None, items_key=None, path=None):
+    """Persist one API response into the identity store"""
+    conn = open_store(path)
+    try:
+        return upsert_records(conn, tenant, endpoint, data, session_id, items_key)
+    finally:
+        conn.close()
+
+def load_page_size(tenant, endpoint, path=None):
+    """Return (page_size, bytes_per_record) tuned by earlier runs, or None"""
+    conn = open_store(path)
+    try:
+        row = conn.execute(
+            "SELECT page_size, bytes_per_record FROM page_sizes WHERE tenant = ? AND endpoint = ?",
+            (tenant, endpoint)
+        ).fetchone()
+        return (row["page_size"], row["bytes_per_record"]) if row else None
+    finally:
+        conn.close()
+
+def save_page_size(tenant, endpoint, page_size, bytes_per_record, path=None):
+    """Remember the tuned page size for a tenant and endpoint"""
+    now = datetime.datetime.now(datetime.timezone.utc).isoformat()
+    conn = open_store(path)
+    try:
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO page_sizes (tenant, endpoint, page_size, bytes_per_record, updated_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (tenant, endpoint, page_size, bytes_per_record, now)
+            )
+    finally:
+        conn.close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Look up objects in the identity store")
+    parser.add_argument("--db", help="Store path (default IDENTITY_STORE_PATH)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    get_cmd = commands.add_parser("get", help="Print the latest stored version of an object")
+    get_cmd.add_argument("--tenant", required=True, help="API base URL the data was fetched from")
+    get_cmd.add_argument("--endpoint", required=True)
+    get_cmd.add_argument("object_id")
+
+    changed_cmd = commands.add_parser("changed", help="List objects of an endpoint changed since a time")
+    changed_cmd.add_argument("--tenant", required=True, help="API base URL the data was fetched from")
+    changed_cmd.add_argument("--endpoint", required=True)
+    changed_cmd.add_argument("--since", required=True, help="ISO timestamp, e.g. 2024-01-31T00:00:00+00:00")
+
+    args = parser.parse_args(argv)
+    conn = open_store(args.db)
+    try:
+        if args.command == "get":
+            record = get_record(conn, args.tenant, args.endpoint, args.object_id)
+            if record is None:
+                raise SystemExit(f"No object '{args.object_id}' stored for {args.endpoint}")
+            print(json.dumps(record))
+        elif args.command == "changed":
+            for object_id, updated_at, record in changed_since(conn, args.tenant, args.endpoint, args.since):
+                print(json.dumps({"id": object_id, "updated_at": updated_at, "record": record}))
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,64 @@
+import json
+import pytest
+import requests
+import coalesce
+import pagination
+from store import load_page_size
+
+TENANT = "https://tenant.example.com"
+ENDPOINT = "/v3/identities"
+
+def make_response(url, body, headers=None):
+    r = requests.Response()
+    r.status_code = 200
+    r.url = url
+    r._content = json.dumps(body).encode("utf-8")
+    r.headers["Content-Type"] = "application/json"
+    r.headers.update(headers or {})
+    return r
+
+class CappedServer:
+    """Offset-paged endpoint that returns at most `cap` records per page"""
+
+    def __init__(self, records, cap, send_total=False):
+        self.records = records
+        self.cap = cap
+        self.send_total = send_total
+        self.requested = []
+
+    def get(self, url, headers=None, auth=None, params=None, **kwargs):
+        limit, offset = int(params["limit"]), int(params["offset"])
+        self.requested.append(limit)
+        page = self.records[offset:offset + min(limit, self.cap)]
+        total = {"X-Total-Count": str(len(self.records))} if self.send_total else None
+        return make_response(url, page, total)
+
+@pytest.fixture(autouse=True)
+def isolated_store(tmp_path, monkeypatch):
+    monkeypatch.setenv("IDENTITY_STORE_PATH", str(tmp_path / "identity_store.db"))
+
+@pytest.mark.parametrize("send_total", [False, True])
+def test_capped_server_returns_every_record(monkeypatch, send_total):
+    records = [{"id": str(i)} for i in range(1000)]
+    server = CappedServer(records, cap=100, send_total=send_total)
+    monkeypatch.setattr(coalesce.requests, "get", server.get)
+
+    result = pagination.fetch_endpoint(TENANT + ENDPOINT, "IdentityNow", TENANT, ENDPOINT, paged=True)
+
+    assert result == records
+    # The tuner learns the server's cap and remembers it for later runs
+    assert server.requested[-1] <= 100
+    page_size, _ = load_page_size(TENANT, ENDPOINT)
+    assert page_size <= 100
+
+def test_remembered_page_size_above_cap_does_not_truncate(monkeypatch):
+    records = [{"id": str(i)} for i in range(1000)]
+    first = CappedServer(records, cap=100)
+    monkeypatch.setattr(coalesce.requests, "get", first.get)
+    pagination.fetch_endpoint(TENANT + ENDPOINT, "IdentityNow", TENANT, ENDPOINT, paged=True)
+
+    # A later run against a server with a lower cap still gets everything
+    second = CappedServer(records, cap=40)
+    monkeypatch.setattr(coalesce.requests, "get", second.get)
+    result = pagination.fetch_endpoint(TENANT + ENDPOINT, "IdentityNow", TENANT, ENDPOINT, paged=True)
+    assert result == records
@@ -1,20 +1,20 @@
 import os
-import io
 import zipfile
 import json
 import datetime
+from profiling import timed
+from backends import atomic_open
 
-def zip_session_folder(folder_path):
-    """Create a ZIP file from a session folder"""
-    zip_buffer = io.BytesIO()
-    with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_DEFLATED) as zf:
+def zip_session_folder(folder_path, fileobj):
+    """Write a ZIP of a session folder to a binary file object"""
+    with zipfile.ZipFile(fileobj, "w", zipfile.ZIP_DEFLATED) as zf:
         for root, dirs, files in os.walk(folder_path):
             for file in files:
                 full_path = os.path.join(root, file)
                 arcname = os.path.relpath(full_path, folder_path)
-                zf.write(full_path, arcname)
-    zip_buffer.seek(0)
-    return zip_buffer
+                # Compacted segments are already gzip-compressed
+                compress_type = zipfile.ZIP_STORED if file.endswith(".gz") else zipfile.ZIP_DEFLATED
+                zf.write(full_path, arcname, compress_type=compress_type)
 
 def handle_path_parameters(endpoint, api_base_url, param_values):
     """Process path parameters for any endpoint"""
@@ -56,19 +56,65 @@ def extract_query_params(endpoint_spec):
             query_params.append(('query', name, required, description))
     return query_params
 
-def save_response_data(data, endpoint, base_save_folder):
-    """Save API response data to file"""
+PARAM_COLUMNS = ["Endpoint", "In", "Parameter", "Required", "Description", "Value"]
+
+def build_param_rows(endpoints_with_params):
+    """Build one parameter form row per (endpoint, parameter)"""
+    rows = []
+    for endpoint, path_params, query_params in endpoints_with_params:
+        for name in path_params:
+            rows.append([endpoint, "path", name, "yes", f"Required path parameter for {endpoint}", ""])
+        for _, name, required, description in query_params:
+            rows.append([endpoint, "query", name, "yes" if required else "no", description, ""])
+    return rows
+
+def collect_param_values(rows):
+    """Collect filled-in form rows into {endpoint: {"path": {...}, "query": {...}}}"""
+    param_values = {}
+    for row in rows or []:
+        if len(row) < len(PARAM_COLUMNS):
+            continue
+        endpoint, location, name, _, _, value = row[:len(PARAM_COLUMNS)]
+        value = "" if value is None else str(value).strip()
+        if not endpoint or not name or not value:
+            continue
+        location = "path" if location == "path" else "query"
+        endpoint_values = param_values.setdefault(endpoint, {"path": {}, "query": {}})
+        endpoint_values[location][name] = value
+    return param_values
+
+@timed("write")
+def save_response_data(data, endpoint, base_save_folder, items_key=None):
+    """Save API response data to file, one JSON record per line.
+
+    `items_key` names the list inside an envelope response (e.g. SCIM
+    "Resources"); its items are written as the records.
+    """
+    if items_key and isinstance(data, dict) and isinstance(data.get(items_key), list):
+        data = data[items_key]
     safe_endpoint_name = endpoint.strip("/").replace("/", "_") or "root"
     timestamp = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
     save_folder = os.path.join(base_save_folder, f"{safe_endpoint_name} ({timestamp})")
     os.makedirs(save_folder, exist_ok=True)
     
     filename = os.path.join(save_folder, "data.jsonl")
-    with open(filename, "w", encoding="utf-8") as f:
+    # Readers and zips never see a partially written file
+    with atomic_open(filename, "w", encoding="utf-8") as f:
         if isinstance(data, list):
             for item in data:
                 f.write(json.dumps(item) + "\n")
         elif isinstance(data, dict):
             f.write(json.dumps(data) + "\n")
         else:
-            f.write(str(data))
\ No newline at end of file
+            f.write(str(data))
+
+@timed("archive")
+def create_session_zip(session_id, backend):
+    """Create ZIP file of session data and store it as a session artifact.
+
+    The archive is streamed to disk rather than built in memory.
+    """
+    session_dir = backend.session_dir(session_id)
+    return backend.write_artifact_stream(
+        session_id, f"session_{session_id}.zip", lambda f: zip_session_folder(session_dir, f)
+    )
\ No newline at end of file